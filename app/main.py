@@ -1,8 +1,10 @@
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+import fitz  # PyMuPDF
+import redis.asyncio as redis
 import os
 import logging
 from pathlib import Path
@@ -11,62 +13,77 @@ from pathlib import Path
 load_dotenv()
 
 from app.routers import flashcards
+from app.templating import templates
 
 # Configure logging
 logging.basicConfig(level=getattr(logging, os.getenv("LOG_LEVEL", "INFO")))
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize and warm up the app before serving, clean up on shutdown"""
+    logger.info("Flashcard Generator API starting up...")
+    
+    # Verify Gemini API key is set
+    if not os.getenv("GEMINI_API_KEY"):
+        logger.warning("GEMINI_API_KEY not set in environment variables")
+    
+    # Create uploads directory if it doesn't exist
+    Path("uploads").mkdir(exist_ok=True)
+    
+    # Flashcard sessions are shared across workers through Redis; open the pool now
+    app.state.redis = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    try:
+        await app.state.redis.ping()
+    except Exception as e:
+        logger.warning(f"Redis is not reachable yet: {str(e)}")
+    
+    # Run a tiny generated PDF through the real extraction path so MuPDF's built-in
+    # font and text-extraction setup happens before the first upload
+    with fitz.open() as warmup_document:
+        warmup_document.new_page().insert_text((72, 72), "Warm up")
+        flashcards.pdf_processor.extract(warmup_document.tobytes())
+    
+    # Load the templates so the first request doesn't pay for compiling them
+    for template_name in ("index.html", "study.html"):
+        templates.get_template(template_name)
+    
+    logger.info("Flashcard Generator API ready!")
+    
+    yield
+    
+    logger.info("Flashcard Generator API shutting down...")
+    
+    # Close Redis and Gemini connections
+    await app.state.redis.aclose()
+    await flashcards.gemini_client.client.aio.aclose()
+    
+    logger.info("Shutdown complete!")
+
 # Create FastAPI app
 app = FastAPI(
     title="Flashcard Generator",
     description="Generate flashcards from PDF documents using Gemini AI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Setup templates and static files
-templates = Jinja2Templates(directory="app/templates")
+# Setup static files
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 # Include routers
 app.include_router(flashcards.router)
 
-# Global storage for flashcard sessions (in production, use Redis or database)
-app.state.sessions = {}
-
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     """Home page with PDF upload form"""
-    return templates.TemplateResponse("index.html", {"request": request})
+    return templates.TemplateResponse(request, "index.html")
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint for Docker"""
     return {"status": "healthy"}
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize app on startup"""
-    logger.info("Flashcard Generator API starting up...")
-    
-    # Verify Gemini API key is set
-    if not os.getenv("GEMINI_API_KEY"):
-        logger.warning("GEMINI_API_KEY not set in environment variables")
-    
-    # Create uploads directory if it doesn't exist
-    Path("uploads").mkdir(exist_ok=True)
-    
-    logger.info("Flashcard Generator API ready!")
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Cleanup on shutdown"""
-    logger.info("Flashcard Generator API shutting down...")
-    
-    # Clear sessions
-    app.state.sessions.clear()
-    
-    logger.info("Shutdown complete!")
-
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=5000, reload=True)
\ No newline at end of file
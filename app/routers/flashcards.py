@@ -1,88 +1,193 @@
-from fastapi import APIRouter, Request, UploadFile, File, HTTPException, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
-import uuid
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import HTMLResponse, StreamingResponse
+from streaming_form_data import StreamingFormDataParser
+from streaming_form_data.parser import ParseFailedException
+from streaming_form_data.targets import ValueTarget
+import asyncio
+import hashlib
+import secrets
+import orjson
 import os
 import logging
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, List, Dict, Any, Optional
 
-from app.services.pdf_processor import PDFProcessor
-from app.services.gemini_client import GeminiClient
+from app.services.pdf_processor import PageLimitError, PDFProcessor
+from app.services.gemini_client import GeminiClient, IncompleteFlashcardsError
+from app.templating import templates
 
 router = APIRouter()
-templates = Jinja2Templates(directory="app/templates")
 logger = logging.getLogger(__name__)
 
 # Initialize services
 pdf_processor = PDFProcessor()
 gemini_client = GeminiClient()
 
-@router.post("/upload")
-async def upload_pdf(request: Request, file: UploadFile = File(...)):
-    """Process uploaded PDF and generate flashcards"""
+# PyMuPDF isn't thread-safe, so all MuPDF work runs on this one thread, off the event loop
+_pdf_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf")
+
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "3600"))
+FLASHCARD_CACHE_TTL_SECONDS = int(os.getenv("FLASHCARD_CACHE_TTL_SECONDS", "86400"))
+
+def _session_key(session_id: str) -> str:
+    """Redis key holding a study session"""
+    return f"sess:{session_id}"
+
+def _flashcard_cache_key(content_digest: str) -> str:
+    """Redis key holding the flashcards generated for a PDF's content digest"""
+    return f"fc:{content_digest}"
+
+async def _load_session(request: Request, session_id: str) -> Dict[str, Any] | None:
+    """Fetch a study session from Redis, or None if it doesn't exist or has expired"""
+    payload = await request.app.state.redis.get(_session_key(session_id))
+    return orjson.loads(payload) if payload is not None else None
+
+async def _extract_text(file_content: bytes) -> str:
+    """Extract and sanity-check the text of an uploaded PDF"""
     
+    # Extract text and page count from PDF (max 5 pages) on the dedicated MuPDF thread
     try:
-        # Validate file
-        if not file.filename.lower().endswith('.pdf'):
-            raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+        text_content, page_count = await asyncio.get_running_loop().run_in_executor(
+            _pdf_executor, pdf_processor.extract, file_content
+        )
+    except PageLimitError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"PDF processing error: {str(e)}")
+        raise HTTPException(status_code=400, detail="Failed to process PDF. Please ensure it's a text-based PDF.")
+    
+    # Check if text was extracted
+    if not text_content or len(text_content.strip()) < 100:
+        raise HTTPException(
+            status_code=400, 
+            detail="Could not extract sufficient text from PDF. Please ensure it contains readable text."
+        )
+    
+    logger.info(f"Extracted {len(text_content)} characters from {page_count} pages")
+    return text_content
+
+async def _replay_cards(flashcards: List[Dict[str, str]]) -> AsyncIterator[Dict[str, str]]:
+    """Yield previously generated flashcards in the same shape as a live Gemini stream"""
+    for card in flashcards:
+        yield card
+
+def _sse(event: str, data: Any) -> bytes:
+    """Encode a server-sent event with a JSON payload"""
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+async def _flashcard_events(
+    request: Request,
+    cards: AsyncIterator[Dict[str, str]],
+    filename: str,
+    cache_key: Optional[str] = None,
+) -> AsyncIterator[bytes]:
+    """Relay flashcards to the client as they arrive, then store the finished study session"""
+    
+    redis = request.app.state.redis
+    flashcards = []
+    complete = True
+    
+    # Generate flashcards using Gemini
+    try:
+        async for card in cards:
+            flashcards.append(card)
+            yield _sse("card", card)
+    except IncompleteFlashcardsError:
+        # Keep the partial deck for this session, but don't cache it for later uploads
+        complete = False
+    except Exception as e:
+        logger.error(f"Gemini API error: {str(e)}")
+        yield _sse("error", {"detail": "Failed to generate flashcards. Please try again."})
+        return
+    
+    if not flashcards:
+        yield _sse("error", {"detail": "No flashcards could be generated from this content."})
+        return
+    
+    try:
+        if cache_key is not None and complete:
+            await redis.set(cache_key, orjson.dumps(flashcards), ex=FLASHCARD_CACHE_TTL_SECONDS)
         
-        # Check file size (10MB limit)
+        # Create session and store flashcards
+        session_id = secrets.token_urlsafe(16)
+        session_data = {
+            "flashcards": flashcards,
+            "filename": filename,
+            "total_cards": len(flashcards)
+        }
+        await redis.set(_session_key(session_id), orjson.dumps(session_data), ex=SESSION_TTL_SECONDS)
+    except Exception as e:
+        logger.error(f"Session storage error: {str(e)}")
+        yield _sse("error", {"detail": "An unexpected error occurred. Please try again."})
+        return
+    
+    logger.info(f"Generated {len(flashcards)} flashcards for session {session_id}")
+    
+    # Tell the client where to study
+    yield _sse("done", {"session_id": session_id, "url": f"/study/{session_id}"})
+
+@router.post("/upload")
+async def upload_pdf(request: Request):
+    """Process uploaded PDF and stream generated flashcards as server-sent events"""
+    
+    try:
+        # Check file size (10MB limit) before reading anything
         max_size = int(os.getenv("MAX_FILE_SIZE_MB", "10")) * 1024 * 1024
-        file_content = await file.read()
-        if len(file_content) > max_size:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"File size exceeds {max_size // (1024*1024)}MB limit"
-            )
-        
-        logger.info(f"Processing file: {file.filename}")
+        size_error = HTTPException(
+            status_code=413,
+            detail=f"File size exceeds {max_size // (1024*1024)}MB limit"
+        )
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_size:
+            raise size_error
         
-        # Extract text from PDF
+        # Stream the multipart body straight into the parser, aborting early if too large
+        file_target = ValueTarget()
+        received = 0
         try:
-            text_content = pdf_processor.extract_text(file_content)
-        except Exception as e:
-            logger.error(f"PDF processing error: {str(e)}")
-            raise HTTPException(status_code=400, detail="Failed to process PDF. Please ensure it's a text-based PDF.")
+            parser = StreamingFormDataParser(headers=request.headers)
+            parser.register("file", file_target)
+            
+            async for chunk in request.stream():
+                received += len(chunk)
+                if received > max_size:
+                    raise size_error
+                parser.data_received(chunk)
+        except ParseFailedException as e:
+            logger.error(f"Upload parsing error: {str(e)}")
+            raise HTTPException(status_code=400, detail="Malformed upload. Please try again.")
         
-        # Validate page count (max 5 pages)
-        page_count = pdf_processor.get_page_count(file_content)
-        if page_count > 5:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"PDF has {page_count} pages. Maximum allowed is 5 pages."
-            )
+        # Validate file
+        filename = file_target.multipart_filename
+        if not filename:
+            raise HTTPException(status_code=400, detail="No PDF file was uploaded")
+        if not filename.lower().endswith('.pdf'):
+            raise HTTPException(status_code=400, detail="Only PDF files are allowed")
         
-        # Check if text was extracted
-        if not text_content or len(text_content.strip()) < 100:
-            raise HTTPException(
-                status_code=400, 
-                detail="Could not extract sufficient text from PDF. Please ensure it contains readable text."
-            )
+        file_content = file_target.value
+        if not file_content.startswith(b'%PDF-'):
+            raise HTTPException(status_code=400, detail="Not a valid PDF file")
         
-        logger.info(f"Extracted {len(text_content)} characters from {page_count} pages")
+        logger.info(f"Processing file: {filename}")
         
-        # Generate flashcards using Gemini
-        try:
-            flashcards = await gemini_client.generate_flashcards(text_content)
-        except Exception as e:
-            logger.error(f"Gemini API error: {str(e)}")
-            raise HTTPException(status_code=500, detail="Failed to generate flashcards. Please try again.")
+        # Reuse flashcards generated for an identical upload
+        cache_key = _flashcard_cache_key(hashlib.sha256(file_content).hexdigest())
+        cached_flashcards = await request.app.state.redis.get(cache_key)
+        if cached_flashcards is not None:
+            flashcards = orjson.loads(cached_flashcards)
+            logger.info(f"Reusing {len(flashcards)} cached flashcards for {filename}")
+            cards = _replay_cards(flashcards)
+            cache_key = None
+        else:
+            text_content = await _extract_text(file_content)
+            cards = gemini_client.stream_flashcards(text_content)
         
-        if not flashcards:
-            raise HTTPException(status_code=400, detail="No flashcards could be generated from this content.")
-        
-        # Create session and store flashcards
-        session_id = str(uuid.uuid4())
-        request.app.state.sessions[session_id] = {
-            "flashcards": flashcards,
-            "filename": file.filename,
-            "total_cards": len(flashcards)
-        }
-        
-        logger.info(f"Generated {len(flashcards)} flashcards for session {session_id}")
-        
-        # Redirect to study page
-        return RedirectResponse(url=f"/study/{session_id}", status_code=303)
+        # Stream flashcards to the client as server-sent events
+        return StreamingResponse(
+            _flashcard_events(request, cards, filename, cache_key),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
         
     except HTTPException:
         raise
@@ -95,14 +200,11 @@ async def study_flashcards(request: Request, session_id: str):
     """Display flashcards for studying"""
     
     # Get session data
-    sessions = request.app.state.sessions
-    if session_id not in sessions:
+    session_data = await _load_session(request, session_id)
+    if session_data is None:
         raise HTTPException(status_code=404, detail="Study session not found or expired")
     
-    session_data = sessions[session_id]
-    
-    return templates.TemplateResponse("study.html", {
-        "request": request,
+    return templates.TemplateResponse(request, "study.html", {
         "session_id": session_id,
         "flashcards": session_data["flashcards"],
         "filename": session_data["filename"],
@@ -113,19 +215,17 @@ async def study_flashcards(request: Request, session_id: str):
 async def get_session_data(request: Request, session_id: str):
     """API endpoint to get session flashcards as JSON"""
     
-    sessions = request.app.state.sessions
-    if session_id not in sessions:
+    session_data = await _load_session(request, session_id)
+    if session_data is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    return sessions[session_id]
+    return session_data
 
 @router.delete("/api/session/{session_id}")
 async def delete_session(request: Request, session_id: str):
     """Delete a study session"""
     
-    sessions = request.app.state.sessions
-    if session_id in sessions:
-        del sessions[session_id]
+    if await request.app.state.redis.delete(_session_key(session_id)):
         return {"message": "Session deleted successfully"}
     
     raise HTTPException(status_code=404, detail="Session not found")
\ No newline at end of file
@@ -1,15 +1,23 @@
 import asyncio
-from xmlrpc import client
 from google import genai
 from google.genai import types
-import json
+import httpx
+import ijson
 import os
 import logging
-import re
-from typing import List, Dict, Any, Optional
+from pydantic import BaseModel
+from typing import AsyncIterator, List, Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 
+class IncompleteFlashcardsError(ValueError):
+    """Raised after streaming every completed card when Gemini's JSON array was cut off"""
+
+class Flashcard(BaseModel):
+    """Schema Gemini's JSON output is constrained to"""
+    question: str
+    answer: str
+
 class GeminiClient:
     """Service for interacting with Google Gemini API to generate flashcards"""
     
@@ -18,8 +26,16 @@ class GeminiClient:
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY environment variable is required")
         
-        # Configure Gemini
-        self.client = genai.Client(api_key=self.api_key)
+        # Configure Gemini with a pooled, keep-alive HTTP client shared across requests
+        self.client = genai.Client(
+            api_key=self.api_key,
+            http_options=types.HttpOptions(
+                timeout=120_000,  # milliseconds
+                async_client_args={
+                    "limits": httpx.Limits(max_connections=64, max_keepalive_connections=32),
+                },
+            ),
+        )
 
         self.model_name = "gemini-2.5-flash"
         
@@ -29,52 +45,85 @@ class GeminiClient:
             top_p=0.8,
             top_k=40,
             max_output_tokens=16384,
+            response_mime_type="application/json",
+            response_schema=list[Flashcard],
         )
     
-    def generate_content(self, prompt):
-        """Generate content with a timeout"""
-        logger.info("Starting LLM generation...")
+    async def generate_content_stream(self, prompt) -> AsyncIterator[str]:
+        """Generate content, yielding response text as Gemini produces it"""
+        logger.info("Starting streaming LLM generation...")
         logger.debug(f"Prompt: {prompt[:500]}...")
         try:
-            response = self.client.models.generate_content(
+            stream = await self.client.aio.models.generate_content_stream(
                 model=self.model_name,
                 contents=prompt,
                 config=self.generation_config
             )
-            return response
+            async for chunk in stream:
+                if chunk.text:
+                    yield chunk.text
         except Exception as e:
-            logger.error(f"Error in LLM generation: {e}")
+            logger.error(f"Error in streaming LLM generation: {e}")
             raise
 
-    async def generate_flashcards(self, text_content: str, num_cards: int = None) -> List[Dict[str, str]]:
-        """Generate flashcards from text content using Gemini"""
+    async def stream_flashcards(self, text_content: str, num_cards: int = None) -> AsyncIterator[Dict[str, str]]:
+        """Generate flashcards from text content, yielding each card as soon as Gemini completes it"""
+        
+        # Estimate appropriate number of cards based on content length
+        if num_cards is None:
+            num_cards = self._estimate_card_count(text_content)
+        
+        prompt = self._create_flashcard_prompt(text_content, num_cards)
+        
+        logger.info(f"Streaming {num_cards} flashcards using Gemini API")
+        
+        # Incrementally parse the JSON array, collecting each element once it closes
+        parsed_cards = ijson.sendable_list()
+        parser = ijson.items_coro(parsed_cards, "item")
+        card_count = 0
         
         try:
-            # Estimate appropriate number of cards based on content length
-            if num_cards is None:
-                num_cards = self._estimate_card_count(text_content)
-            
-            # Create the prompt
-            prompt = self._create_flashcard_prompt(text_content, num_cards)
-            
-            logger.info(f"Generating {num_cards} flashcards using Gemini API")
+            async for text in self.generate_content_stream(prompt):
+                parser.send(text.encode())
+                for card in self._drain_valid_cards(parsed_cards):
+                    card_count += 1
+                    yield card
             
-            # Generate content
-            response = self.generate_content(prompt)
+            incomplete_error = None
+            try:
+                parser.close()
+            except ijson.JSONError as e:
+                incomplete_error = e
             
-            # Parse the response
-            flashcards = self._parse_flashcard_response(response.text) # type: ignore
+            # A truncated response still yields every card completed before the cut-off
+            for card in self._drain_valid_cards(parsed_cards):
+                card_count += 1
+                yield card
             
-            logger.info(f"Successfully generated {len(flashcards)} flashcards")
-            return flashcards
+            if incomplete_error is not None:
+                raise IncompleteFlashcardsError(
+                    f"Gemini response was cut off after {card_count} flashcards"
+                ) from incomplete_error
             
+        except IncompleteFlashcardsError as e:
+            logger.warning(str(e))
+            raise
         except Exception as e:
-            logger.error(f"Error generating flashcards: {str(e)}")
+            logger.error(f"Error streaming flashcards: {str(e)}")
             raise
+        
+        logger.info(f"Successfully streamed {card_count} flashcards")
+    
+    def _drain_valid_cards(self, parsed_cards: list) -> List[Dict[str, str]]:
+        """Return the valid flashcards parsed so far and empty the parser's buffer"""
+        cards = [card for card in map(self._validate_card, parsed_cards) if card is not None]
+        del parsed_cards[:]
+        return cards
     
     def _estimate_card_count(self, text_content: str) -> int:
         """Estimate appropriate number of flashcards based on content length"""
-        word_count = len(text_content.split())
+        # Count separators rather than splitting, which would build a list of every word
+        word_count = text_content.count(' ') + text_content.count('\n') + 1
         
         if word_count < 200:
             return 3
@@ -121,111 +170,18 @@ Generate exactly {num_cards} flashcards in the JSON format specified above:"""
 
         return prompt
     
-    def _parse_flashcard_response(self, response_text: str) -> List[Dict[str, str]]:
-        """Parse the Gemini response and extract flashcards"""
-        
-        try:
-            # Clean the response text
-            cleaned_text = self._clean_response_text(response_text)
-            
-            # Try to parse as JSON
-            flashcards = json.loads(cleaned_text)
-            
-            # Validate the structure
-            if not isinstance(flashcards, list):
-                raise ValueError("Response is not a list")
-            
-            validated_cards = []
-            for card in flashcards:
-                if not isinstance(card, dict):
-                    continue
-                
-                if "question" not in card or "answer" not in card:
-                    continue
-                
-                question = str(card["question"]).strip()
-                answer = str(card["answer"]).strip()
-                
-                if not question or not answer:
-                    continue
-                
-                if len(question) < 10 or len(answer) < 5:
-                    continue
-                
-                validated_cards.append({
-                    "question": question,
-                    "answer": answer
-                })
-            
-            if not validated_cards:
-                raise ValueError("No valid flashcards found in response")
-            
-            return validated_cards
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parsing error: {str(e)}")
-            # Try to extract flashcards using regex as fallback
-            return self._extract_flashcards_fallback(response_text)
-        
-        except Exception as e:
-            logger.error(f"Error parsing flashcard response: {str(e)}")
-            raise
-    
-    def _clean_response_text(self, text: str) -> str:
-        """Clean the response text to extract JSON"""
+    def _validate_card(self, card: Any) -> Optional[Dict[str, str]]:
+        """Normalize a parsed flashcard, or return None if it is malformed or too short"""
+        if not isinstance(card, dict):
+            return None
         
-        # Remove markdown code blocks
-        text = re.sub(r'```json\s*', '', text)
-        text = re.sub(r'```\s*', '', text)
+        question = str(card.get("question", "")).strip()
+        answer = str(card.get("answer", "")).strip()
         
-        # Find JSON array bounds
-        start_idx = text.find('[')
-        end_idx = text.rfind(']')
+        if len(question) < 10 or len(answer) < 5:
+            return None
         
-        if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-            text = text[start_idx:end_idx + 1]
-        
-        return text.strip()
-    
-    def _extract_flashcards_fallback(self, text: str) -> List[Dict[str, str]]:
-        """Fallback method to extract flashcards using regex"""
-        
-        flashcards = []
-        
-        # Try to find question-answer pairs in various formats
-        patterns = [
-            r'["\']question["\']\s*:\s*["\']([^"\']+)["\'],?\s*["\']answer["\']\s*:\s*["\']([^"\']+)["\']',
-            r'Q:\s*([^\n]+)\s*A:\s*([^\n]+)',
-            r'Question:\s*([^\n]+)\s*Answer:\s*([^\n]+)',
-        ]
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE | re.DOTALL)
-            for match in matches:
-                if len(match) == 2:
-                    question = match[0].strip()
-                    answer = match[1].strip()
-                    
-                    if len(question) > 10 and len(answer) > 5:
-                        flashcards.append({
-                            "question": question,
-                            "answer": answer
-                        })
-        
-        if not flashcards:
-            # Create a fallback flashcard
-            flashcards = [{
-                "question": "What was the main topic of the uploaded document?",
-                "answer": "Please review the document content to understand the main concepts and topics covered."
-            }]
-        
-        return flashcards[:15]  # Limit to 15 cards max
-    
-    def test_connection(self) -> bool:
-        """Test the Gemini API connection"""
-        try:
-            response = self.generate_content("Test connection")
-            return True
-        except Exception as e:
-            logger.error(f"Gemini API test failed: {str(e)}")
-            return False
\ No newline at end of file
+        return {
+            "question": question,
+            "answer": answer
+        }
@@ -0,0 +1,13 @@
+from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache
+import os
+
+# Shared by the app and all routers
+templates = Jinja2Templates(directory="app/templates")
+
+# Compiled templates are cached on disk so restarted workers skip Jinja's parse/compile step.
+# Without JINJA_CACHE_DIR, Jinja uses its own private per-user temp directory.
+templates.env.bytecode_cache = FileSystemBytecodeCache(os.getenv("JINJA_CACHE_DIR"))
+
+# Jinja re-checks template files for changes by default; production turns this off
+templates.env.auto_reload = os.getenv("TEMPLATES_AUTO_RELOAD", "true").lower() != "false"